@@ -5,12 +5,12 @@ from frappe import _
 from frappe.utils import now
 import uuid
 from werkzeug.wrappers import Response
-import json
+import orjson
 from frappe.core.doctype.user.user import reset_password
 
 # --- CORS Helper ---
 def cors_response(body, status=200):
-    response = Response(json.dumps(body), status=status, content_type="application/json")
+    response = Response(orjson.dumps(body, default=str), status=status, content_type="application/json")
     response.headers["Access-Control-Allow-Origin"] = "http://localhost:8081"
     response.headers["Access-Control-Allow-Credentials"] = "true"
     response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
@@ -1,17 +1,34 @@
 import frappe
 from frappe import _
-from frappe.utils import now
+from frappe.model import default_fields
+from frappe.utils import cint, now
 import uuid
-from werkzeug.wrappers import Response
-import json
-import pandas as pd
-from io import BytesIO
+from datetime import date, time
+from faithful_registration.api.imam import MAX_PAGE_SIZE, _response, _error
+
+
+_DT = (date, time)  # datetime is a subclass of date
+
+HOUSEHOLD_LIST_CACHE_KEY = "household:list:v1:"
+
+
 def safe_date(val):
-    return val.isoformat() if hasattr(val, "isoformat") else val
+    return val.isoformat() if isinstance(val, _DT) else val
+
+def clear_household_list_cache(doc=None, method=None):
+    """doc_events hook: drop every cached page of get_all_households."""
+    if frappe.flags.in_household_bulk_upload:
+        return  # bulk_register_households clears once when it is done
+    frappe.cache().delete_keys(HOUSEHOLD_LIST_CACHE_KEY)
+
 
 @frappe.whitelist(allow_guest=True, methods=["POST"])
 def bulk_register_households():
     """Upload an Excel file to create multiple Household records in bulk."""
+    # pandas is heavy; import it here so workers that never bulk-upload don't pay for it
+    from io import BytesIO
+
+    import pandas as pd
 
     request_id = str(uuid.uuid4())
     timestamp = now()
@@ -21,7 +38,12 @@ def bulk_register_households():
         if not file:
             raise frappe.ValidationError("No Excel file uploaded.")
 
-        df = pd.read_excel(BytesIO(file.read()))
+        content = BytesIO(file.read())
+        # Fix text column types from a 1000-row sample so the full parse doesn't infer them again
+        probe = pd.read_excel(content, nrows=1000)
+        dtypes = {col: "string" for col in probe.columns if probe[col].dtype == object}
+        content.seek(0)
+        df = pd.read_excel(content, dtype=dtypes)
         if "household_name" not in df.columns:
             raise frappe.ValidationError("Missing required column: 'household_name'.")
 
@@ -29,13 +51,43 @@ def bulk_register_households():
         created, duplicates, failed = 0, 0, 0
         failed_records = []
 
-        for _, row in df.iterrows():
+        # Clean the name column and find empty cells in vectorised passes, not per row
+        df["household_name"] = df["household_name"].astype("string").str.strip().fillna("")
+        names = df["household_name"]
+        cols = df.columns.tolist()
+        present = df.notna().to_numpy()
+
+        # One query for every name in the sheet instead of an exists() per row
+        existing = set(frappe.get_all(
+            "Household",
+            filters={"household_name": ["in", names.unique().tolist()]},
+            pluck="household_name"
+        )) if total else set()
+        # Repeats within the sheet are rejected up front, without a savepoint or insert attempt
+        # (blank names are left to the required check below)
+        repeated = (names.duplicated(keep="first") & names.ne("")).to_numpy()
+
+        # One transaction for the whole upload; a savepoint per row keeps failures isolated
+        frappe.db.begin()
+        frappe.flags.in_household_bulk_upload = True
+        for i, row in enumerate(df.itertuples(index=False, name=None)):
+            if repeated[i]:
+                duplicates += 1
+                failed_records.append({
+                    "household_name": names.iat[i],
+                    "error": "In-batch duplicate"
+                })
+                continue
+
+            save_point = f"household_row_{i}"
+            frappe.db.savepoint(save_point)
             try:
-                household_name = str(row.get("household_name")).strip()
+                household_name = names.iat[i]
                 if not household_name:
                     raise frappe.ValidationError("household_name is required.")
 
-                if frappe.db.exists("Household", {"household_name": household_name}):
+                if household_name in existing:
+                    frappe.db.release_savepoint(save_point)
                     duplicates += 1
                     failed_records.append({
                         "household_name": household_name,
@@ -44,21 +96,26 @@ def bulk_register_households():
                     continue
 
                 doc = frappe.new_doc("Household")
-                for col in df.columns:
-                    value = row.get(col)
-                    if pd.notna(value):
-                        doc.set(col, value)
+                for j, col in enumerate(cols):
+                    if present[i, j]:
+                        doc.set(col, row[j])
                 doc.insert(ignore_permissions=True)
+                # Release it straight away; unreleased savepoints pile up and slow every later one
+                frappe.db.release_savepoint(save_point)
+                existing.add(household_name)
                 created += 1
 
             except Exception as e:
+                frappe.db.rollback(save_point=save_point)
                 failed += 1
                 failed_records.append({
-                    "household_name": row.get("household_name", "Unknown"),
+                    "household_name": names.iat[i] or "Unknown",
                     "error": str(e)
                 })
                 frappe.log_error(frappe.get_traceback(), "Bulk Household Upload Error")
 
+        frappe.flags.in_household_bulk_upload = False
+
         failed_file_url = None
         if failed_records:
             failed_df = pd.DataFrame(failed_records)
@@ -75,41 +132,48 @@ def bulk_register_households():
             file_doc.save(ignore_permissions=True)
             failed_file_url = file_doc.file_url
 
-        response = {
-            "data": {
+        frappe.db.commit()
+        if created:
+            clear_household_list_cache()
+
+        return _response(
+            {
                 "total": total,
                 "created": created,
                 "duplicates": duplicates,
                 "failed": failed,
                 "failed_file_url": failed_file_url
             },
-            "status": "success",
-            "code": 200,
-            "message": f"Processed {total} records. Created: {created}, Duplicates: {duplicates}, Failed: {failed}.",
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
+            status=200,
+            message=f"Processed {total} records. Created: {created}, Duplicates: {duplicates}, Failed: {failed}.",
+            code=200,
+            meta={"request_id": request_id, "timestamp": timestamp}
+        )
 
-        return Response(json.dumps(response), status=200, content_type="application/json")
+    except frappe.ValidationError as e:
+        frappe.db.rollback()
+        return _error(
+            "Bulk household upload failed.",
+            400,
+            400,
+            errors={
+                "description": str(e)
+            },
+            meta={"request_id": request_id, "timestamp": timestamp}
+        )
 
     except Exception as e:
+        frappe.db.rollback()
         frappe.log_error(frappe.get_traceback(), "Bulk Household Upload Failed")
-        error = {
-            "data": None,
-            "status": "error",
-            "code": 500,
-            "message": "Bulk household upload failed.",
-            "errors": {
+        return _error(
+            "Bulk household upload failed.",
+            500,
+            500,
+            errors={
                 "description": str(e)
             },
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
-        return Response(json.dumps(error), status=500, content_type="application/json")
+            meta={"request_id": request_id, "timestamp": timestamp}
+        )
 
 
 @frappe.whitelist(allow_guest=True)
@@ -128,115 +192,103 @@ def create_household():
         doc.update(payload)
         doc.insert(ignore_permissions=True)
 
-        response = {
-            "data": {k: safe_date(v) for k, v in doc.as_dict().items()},
-            "status": "success",
-            "code": 201,
-            "message": "Household created successfully.",
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
-        return Response(json.dumps(response), status=201, content_type="application/json")
+        return _response(
+            doc.as_dict(),
+            status=201,
+            message="Household created successfully.",
+            code=201,
+            meta={"request_id": request_id, "timestamp": timestamp}
+        )
 
     except frappe.DuplicateEntryError:
-        frappe.log_error(frappe.get_traceback(), "Duplicate Household Creation")
-        error = {
-            "data": None,
-            "status": "error",
-            "code": 409,
-            "message": "Duplicate entry error.",
-            "errors": {
+        return _error(
+            "Duplicate entry error.",
+            409,
+            409,
+            errors={
                 "description": "A household with the same name already exists."
             },
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
-        return Response(json.dumps(error), status=409, content_type="application/json")
+            meta={"request_id": request_id, "timestamp": timestamp}
+        )
 
     except frappe.ValidationError as e:
-        error = {
-            "data": None,
-            "status": "error",
-            "code": 400,
-            "message": "Validation failed.",
-            "errors": {
+        return _error(
+            "Validation failed.",
+            400,
+            400,
+            errors={
                 "description": str(e)
             },
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
-        return Response(json.dumps(error), status=400, content_type="application/json")
+            meta={"request_id": request_id, "timestamp": timestamp}
+        )
 
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Household Creation Failed")
-        error = {
-            "data": None,
-            "status": "error",
-            "code": 400,
-            "message": "Failed to create household.",
-            "errors": {
+        return _error(
+            "Failed to create household.",
+            400,
+            400,
+            errors={
                 "description": str(e)
             },
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
-        return Response(json.dumps(error), status=400, content_type="application/json")
+            meta={"request_id": request_id, "timestamp": timestamp}
+        )
 
 
 @frappe.whitelist(allow_guest=True)
-def get_all_households():
+def get_all_households(limit=100, after=None):
+    """Page through Households newest first; pass `after` = previous `next_cursor`."""
     request_id = str(uuid.uuid4())
     timestamp = now()
 
     try:
-        records = frappe.get_all(
-            "Household",
-            fields=[
-                "name", "household_name", "head_of_household", "address_line",
-                "mosque", "total_members", "creation"
-            ],
-            order_by="creation desc"
-        )
-
-        for r in records:
-            r["creation"] = safe_date(r["creation"])
-
-        response = {
-            "data": records,
-            "status": "success",
-            "code": 200,
-            "message": "Households retrieved successfully.",
-            "meta": {
+        limit = min(max(cint(limit) or 100, 1), MAX_PAGE_SIZE)
+        cache_key = f"{HOUSEHOLD_LIST_CACHE_KEY}{limit}:{after or ''}"
+
+        records = frappe.cache().get_value(cache_key)
+        if records is None:
+            filters = {"creation": ["<", after]} if after else None
+
+            records = frappe.get_all(
+                "Household",
+                filters=filters,
+                fields=[
+                    "name", "household_name", "head_of_household", "address_line",
+                    "mosque", "total_members", "creation"
+                ],
+                order_by="creation desc",
+                limit_page_length=limit
+            )
+
+            for r in records:
+                r["creation"] = safe_date(r["creation"])
+
+            frappe.cache().set_value(cache_key, records, expires_in_sec=30)
+
+        return _response(
+            records,
+            status=200,
+            message="Households retrieved successfully.",
+            code=200,
+            meta={
                 "request_id": request_id,
-                "timestamp": timestamp
+                "timestamp": timestamp,
+                "limit": limit,
+                "next_cursor": records[-1]["creation"] if len(records) == limit else None
             }
-        }
-        return Response(json.dumps(response), status=200, content_type="application/json")
+        )
 
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Get All Households Failed")
-        error = {
-            "data": None,
-            "status": "error",
-            "code": 400,
-            "message": "Failed to retrieve households.",
-            "errors": {
+        return _error(
+            "Failed to retrieve households.",
+            400,
+            400,
+            errors={
                 "description": str(e)
             },
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
-        return Response(json.dumps(error), status=400, content_type="application/json")
+            meta={"request_id": request_id, "timestamp": timestamp}
+        )
 
 
 @frappe.whitelist(allow_guest=True)
@@ -246,56 +298,39 @@ def get_household(name):
 
     try:
         doc = frappe.get_doc("Household", name)
+        # _response encodes date/datetime values, no per-field conversion needed
         doc_dict = doc.as_dict()
 
-        for key, value in doc_dict.items():
-            if hasattr(value, "isoformat"):
-                doc_dict[key] = value.isoformat()
-
-        response = {
-            "data": doc_dict,
-            "status": "success",
-            "code": 200,
-            "message": "Household retrieved successfully.",
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
-        return Response(json.dumps(response), status=200, content_type="application/json")
+        return _response(
+            doc_dict,
+            status=200,
+            message="Household retrieved successfully.",
+            code=200,
+            meta={"request_id": request_id, "timestamp": timestamp}
+        )
 
     except frappe.DoesNotExistError:
-        error = {
-            "data": None,
-            "status": "error",
-            "code": 404,
-            "message": "Household not found.",
-            "errors": {
+        return _error(
+            "Household not found.",
+            404,
+            404,
+            errors={
                 "description": f"No Household found with name '{name}'."
             },
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
-        return Response(json.dumps(error), status=404, content_type="application/json")
+            meta={"request_id": request_id, "timestamp": timestamp}
+        )
 
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Get Household Failed")
-        error = {
-            "data": None,
-            "status": "error",
-            "code": 400,
-            "message": "Failed to retrieve household.",
-            "errors": {
+        return _error(
+            "Failed to retrieve household.",
+            400,
+            400,
+            errors={
                 "description": str(e)
             },
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
-        return Response(json.dumps(error), status=400, content_type="application/json")
+            meta={"request_id": request_id, "timestamp": timestamp}
+        )
 
 
 @frappe.whitelist(allow_guest=True, methods=["POST"])
@@ -309,74 +344,70 @@ def update_household():
             raise frappe.ValidationError("Missing 'data' object in payload.")
 
         payload = data["data"]
-        name = payload.get("name")
+        name = payload.pop("name", None)
         if not name:
             raise frappe.ValidationError("Missing 'name' field in data for update.")
 
-        doc = frappe.get_doc("Household", name)
-        doc.update(payload)
-        doc.save(ignore_permissions=True)
-
-        response = {
-            "data": {k: safe_date(v) if hasattr(v, "isoformat") else v for k, v in doc.as_dict().items()},
-            "status": "success",
-            "code": 200,
-            "message": "Household updated successfully.",
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
-        return Response(json.dumps(response), status=200, content_type="application/json")
+        # Clients often echo a get_household body back; never write its doctype/audit fields
+        payload = {k: v for k, v in payload.items() if k not in default_fields}
+        columns = set(frappe.get_meta("Household").get_valid_columns())
+
+        if any(isinstance(v, list) for v in payload.values()) or not columns.issuperset(payload):
+            # Child tables and non-column keys need the full document save
+            doc = frappe.get_doc("Household", name)
+            doc.update(payload)
+            doc.save(ignore_permissions=True)
+            household = doc.as_dict()
+        else:
+            # Plain field updates: a single UPDATE of just the sent columns
+            if not frappe.db.exists("Household", name):
+                raise frappe.DoesNotExistError
+            if payload:
+                frappe.db.set_value("Household", name, payload)
+                clear_household_list_cache()  # set_value skips the doc_events hooks
+            household = {"name": name, **payload}
+
+        return _response(
+            household,
+            status=200,
+            message="Household updated successfully.",
+            code=200,
+            meta={"request_id": request_id, "timestamp": timestamp}
+        )
 
     except frappe.DoesNotExistError:
-        error = {
-            "data": None,
-            "status": "error",
-            "code": 404,
-            "message": "Household not found.",
-            "errors": {
+        return _error(
+            "Household not found.",
+            404,
+            404,
+            errors={
                 "description": f"No Household found with name '{name}'."
             },
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
-        return Response(json.dumps(error), status=404, content_type="application/json")
+            meta={"request_id": request_id, "timestamp": timestamp}
+        )
 
     except frappe.ValidationError as e:
-        error = {
-            "data": None,
-            "status": "error",
-            "code": 400,
-            "message": "Failed to update household.",
-            "errors": {
+        return _error(
+            "Failed to update household.",
+            400,
+            400,
+            errors={
                 "description": str(e)
             },
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
-        return Response(json.dumps(error), status=400, content_type="application/json")
+            meta={"request_id": request_id, "timestamp": timestamp}
+        )
 
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Update Household Failed")
-        error = {
-            "data": None,
-            "status": "error",
-            "code": 400,
-            "message": "Failed to update household.",
-            "errors": {
+        return _error(
+            "Failed to update household.",
+            400,
+            400,
+            errors={
                 "description": str(e)
             },
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
-        return Response(json.dumps(error), status=400, content_type="application/json")
+            meta={"request_id": request_id, "timestamp": timestamp}
+        )
 
 
 @frappe.whitelist(allow_guest=True)
@@ -388,47 +419,33 @@ def delete_household(name):
         doc = frappe.get_doc("Household", name)
         doc.delete(ignore_permissions=True)
 
-        response = {
-            "data": {"name": name},
-            "status": "success",
-            "code": 200,
-            "message": "Household deleted successfully.",
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
-        return Response(json.dumps(response), status=200, content_type="application/json")
+        return _response(
+            {"name": name},
+            status=200,
+            message="Household deleted successfully.",
+            code=200,
+            meta={"request_id": request_id, "timestamp": timestamp}
+        )
 
     except frappe.DoesNotExistError:
-        error = {
-            "data": None,
-            "status": "error",
-            "code": 404,
-            "message": "Household not found.",
-            "errors": {
+        return _error(
+            "Household not found.",
+            404,
+            404,
+            errors={
                 "description": f"No Household found with name '{name}'."
             },
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
-        return Response(json.dumps(error), status=404, content_type="application/json")
+            meta={"request_id": request_id, "timestamp": timestamp}
+        )
 
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Delete Household Failed")
-        error = {
-            "data": None,
-            "status": "error",
-            "code": 400,
-            "message": "Failed to delete household.",
-            "errors": {
+        return _error(
+            "Failed to delete household.",
+            400,
+            400,
+            errors={
                 "description": str(e)
             },
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
-        return Response(json.dumps(error), status=400, content_type="application/json")
+            meta={"request_id": request_id, "timestamp": timestamp}
+        )
@@ -2,15 +2,54 @@
 
 import frappe, json, uuid, tempfile
 from frappe import _
-from frappe.utils import now, get_files_path
+from frappe.utils import cint, now, get_files_path
 from werkzeug.wrappers import Response
-import pandas as pd
+import orjson
 import base64, re, os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 # ——————————————————————————————————————————————————————————————
 # Helpers
 # ——————————————————————————————————————————————————————————————
 
+IMAM_REQUIRED_FIELDS = ("faithful", "mosque_assigned", "date_appointed")
+# Link fields checked by hand in bulk_upload_imams, whose bulk_insert skips Link validation
+IMAM_LINK_FIELDS = (("faithful", "Faithful Profile"), ("mosque_assigned", "Mosque"))
+IMAM_LIST_FIELDS = (
+    "name",
+    "faithful",
+    "mosque_assigned",
+    "date_appointed",
+    "years_of_experience",
+    "role_in_mosque",
+    "status",
+)
+# Built once at import; get_all_imams only fills in the WHERE clause
+_IMAM_LIST_SQL = (
+    f"SELECT {', '.join(f'`{f}`' for f in IMAM_LIST_FIELDS)} FROM `tabImam` {{where}} "
+    # name breaks creation ties (a bulk upload stamps every row alike) so OFFSET pages stay stable
+    "ORDER BY creation DESC, name DESC LIMIT %(limit)s OFFSET %(start)s"
+)
+_IMAM_COUNT_SQL = "SELECT COUNT(*) FROM `tabImam` {where}"
+PROFILE_FIELDS = (
+    "full_name",
+    "date_of_birth",
+    "place_of_birth",
+    "gender",
+    "marital_status",
+    "phone",
+    "email",
+    "profile_image",
+    "national_id_number",
+    "special_needs_proof",
+)
+# Profile columns as they appear in Imam responses (full_name is renamed to imam_name)
+PROFILE_OUTPUT_FIELDS = ("imam_name", *PROFILE_FIELDS[1:])
+BULK_COMMIT_SIZE = 500
+MAX_PAGE_SIZE = 500  # upper bound on `limit` for every list endpoint
+_DATA_URL_RE = re.compile(r"data:(.*?);base64,(.*)", re.DOTALL)
+
 
 def _response(data, status=200, message="Success", code=None, errors=None, meta=None):
     payload = {
@@ -25,9 +64,12 @@ def _response(data, status=200, message="Success", code=None, errors=None, meta=
     if meta:
         payload["meta"] = meta
 
-    # Use default=str so datetime (and other types) become strings
+    # orjson encodes date/datetime natively; default=str covers the rest (Decimal, …).
+    # Returning a Response skips Frappe's own response builder, so the payload is encoded once.
     return Response(
-        json.dumps(payload, default=str), status=status, content_type="application/json"
+        orjson.dumps(payload, default=str, option=orjson.OPT_SERIALIZE_NUMPY),
+        status=status,
+        content_type="application/json",
     )
 
 
@@ -37,6 +79,67 @@ def _error(message, code, status, errors=None, meta=None):
     )
 
 
+def _mosque_name_key(mosque_id):
+    return f"mosque:name:{mosque_id}"
+
+
+def _mosque_names(mosque_ids):
+    """Map Mosque id -> mosque_name; cached in Redis, one query for any misses."""
+    cache = frappe.cache()
+    names, missing = {}, []
+    for mosque_id in mosque_ids:
+        value = cache.get_value(_mosque_name_key(mosque_id))
+        if value is None:
+            missing.append(mosque_id)
+        else:
+            names[mosque_id] = value
+
+    if missing:
+        found = dict(
+            frappe.get_all(
+                "Mosque",
+                filters={"name": ["in", missing]},
+                fields=["name", "mosque_name"],
+                as_list=True,
+            )
+        )
+        for mosque_id in missing:
+            names[mosque_id] = found.get(mosque_id) or mosque_id
+            cache.set_value(
+                _mosque_name_key(mosque_id), names[mosque_id], expires_in_sec=3600
+            )
+
+    return names
+
+
+def clear_mosque_name_cache(doc, method=None):
+    """doc_events hook for Mosque on_update / on_trash."""
+    frappe.cache().delete_value(_mosque_name_key(doc.name))
+
+
+def _imam_by_faithful_key(faithful):
+    return f"imam:by_faithful:{faithful}"
+
+
+def _imam_for_faithful(faithful):
+    """Resolve faithful -> Imam name, cached in Redis for the per-user lookups."""
+    key = _imam_by_faithful_key(faithful)
+    name = frappe.cache().get_value(key)
+    if not name:
+        name = frappe.db.get_value("Imam", {"faithful": faithful}, "name")
+        if name:
+            frappe.cache().set_value(key, name, expires_in_sec=3600)
+    return name
+
+
+def clear_imam_by_faithful_cache(doc, method=None):
+    """doc_events hook for Imam on_update / on_trash; also drops a reassigned faithful."""
+    before = doc.get_doc_before_save()
+    for faithful in {doc.faithful, before and before.faithful}:
+        if faithful:
+            frappe.cache().delete_value(_imam_by_faithful_key(faithful))
+
+
 # ——————————————————————————————————————————————————————————————
 # Simple Reads
 # ——————————————————————————————————————————————————————————————
@@ -54,92 +157,105 @@ def get_imams_by_mosque(mosque_assigned):
 
 @frappe.whitelist(allow_guest=True, methods=["GET", "POST"])
 def get_all_imams():
+    """
+    Imam list with profile fields, mosque_name and certifications.
+    Optional `fields=a,b,c` trims the output and skips lookups it doesn't need;
+    paged with `limit` (default 50) and `start`.
+    """
+    form = frappe.local.form_dict
     filters = {
         k: v
-        for k, v in frappe.local.form_dict.items()
-        if k not in ("cmd", "data") and v
+        for k, v in form.items()
+        if k not in ("cmd", "data", "fields", "limit", "start") and v
     }
-
-    records = frappe.get_all(
-        "Imam",
-        filters=filters or None,
-        fields=[
-            "name",
-            "faithful",
-            "mosque_assigned",
-            "date_appointed",
-            "years_of_experience",
-            "role_in_mosque",
-            "status",
-        ],
-        order_by="creation desc",
+    limit = min(max(cint(form.get("limit")) or 50, 1), MAX_PAGE_SIZE)
+    start = max(cint(form.get("start")), 0)
+    requested = {f.strip() for f in (form.get("fields") or "").split(",") if f.strip()}
+
+    def wants(*keys):
+        return not requested or not requested.isdisjoint(keys)
+
+    # Filter keys are interpolated as column names, so only accept real Imam columns
+    unknown = set(filters) - set(frappe.get_meta("Imam").get_valid_columns())
+    if unknown:
+        return _error(f"Unknown filter field(s): {', '.join(sorted(unknown))}", 400, 400)
+
+    where = "WHERE " + " AND ".join(f"`{k}` = %({k})s" for k in filters) if filters else ""
+    records = frappe.db.sql(
+        _IMAM_LIST_SQL.format(where=where),
+        {**filters, "limit": limit, "start": start},
+        as_dict=True,
     )
 
-    for r in records:
-        # — Profile fields —
-        prof = (
-            frappe.db.get_value(
-                "Faithful Profile",
-                r["faithful"],
-                [
-                    "full_name",
-                    "date_of_birth",
-                    "place_of_birth",
-                    "gender",
-                    "marital_status",
-                    "phone",
-                    "email",
-                    "profile_image",
-                    "national_id_number",
-                    "special_needs_proof",
-                ],
-                as_dict=1,
-            )
-            or {}
-        )
-
-        r.update(
+    # COUNT(*) is the expensive part of paging; reuse it for a minute per filter set
+    count_key = f"imam:count:{json.dumps(filters, sort_keys=True)}"
+    total = frappe.cache().get_value(count_key)
+    if total is None:
+        total = frappe.db.sql(_IMAM_COUNT_SQL.format(where=where), filters)[0][0]
+        frappe.cache().set_value(count_key, total, expires_in_sec=60)
+    meta = {"total": total, "limit": limit, "start": start}
+
+    # — Batch the related lookups: one query per doctype instead of per row —
+    if wants(*PROFILE_OUTPUT_FIELDS):
+        faithful_ids = list({r["faithful"] for r in records if r.get("faithful")})
+        profiles = (
             {
-                "imam_name": prof.get("full_name"),
-                "date_of_birth": prof.get("date_of_birth"),
-                "place_of_birth": prof.get("place_of_birth"),
-                "gender": prof.get("gender"),
-                "marital_status": prof.get("marital_status"),
-                "phone": prof.get("phone"),
-                "email": prof.get("email"),
-                "profile_image": prof.get("profile_image"),
-                "national_id_number": prof.get("national_id_number"),
-                "special_needs_proof": prof.get("special_needs_proof"),
+                p.name: p
+                for p in frappe.get_all(
+                    "Faithful Profile",
+                    filters={"name": ["in", faithful_ids]},
+                    fields=["name", *PROFILE_FIELDS],
+                )
             }
+            if faithful_ids
+            else {}
         )
 
-        # — Mosque display name —
-        if r.get("mosque_assigned"):
-            r["mosque_name"] = (
-                frappe.db.get_value("Mosque", r["mosque_assigned"], "mosque_name")
-                or r["mosque_assigned"]
-            )
+        for r in records:
+            prof = profiles.get(r["faithful"]) or {}
+            r.update({f: prof.get(f) for f in PROFILE_FIELDS})
+            r["imam_name"] = r.pop("full_name")
 
-        # — Certifications (trimmed) —
-        certs = frappe.get_all(
-            "Imam Certification",
-            filters={
-                "parent": r["name"],
-                "parenttype": "Imam",
-                "parentfield": "certifications",
-            },
-            fields=[
-                "idx",
-                "certification_name",
-                "issuing_body",
-                "date_awarded",
-                "attachment",
-            ],
-            order_by="idx",
+    # — Mosque display name —
+    if wants("mosque_name"):
+        mosques = _mosque_names(
+            list({r["mosque_assigned"] for r in records if r.get("mosque_assigned")})
         )
-        r["certifications"] = certs
+        for r in records:
+            if r.get("mosque_assigned"):
+                r["mosque_name"] = mosques.get(r["mosque_assigned"]) or r["mosque_assigned"]
+
+    # — Certifications (trimmed) —
+    if wants("certifications"):
+        certs_by_parent = defaultdict(list)
+        imam_names = [r["name"] for r in records]
+        if imam_names:
+            for cert in frappe.get_all(
+                "Imam Certification",
+                filters={
+                    "parent": ["in", imam_names],
+                    "parenttype": "Imam",
+                    "parentfield": "certifications",
+                },
+                fields=[
+                    "parent",
+                    "idx",
+                    "certification_name",
+                    "issuing_body",
+                    "date_awarded",
+                    "attachment",
+                ],
+                order_by="parent, idx",
+            ):
+                certs_by_parent[cert.pop("parent")].append(cert)
+
+        for r in records:
+            r["certifications"] = certs_by_parent[r["name"]]
+
+    if requested:
+        records = [{k: r[k] for k in requested if k in r} for r in records]
 
-    return _response(records)
+    return _response(records, meta=meta)
 
 
 @frappe.whitelist(allow_guest=True)
@@ -154,66 +270,72 @@ def get_imam(name=None, faithful=None):
     if not name and not faithful:
         return _error("Provide `name` or `faithful`", 400, 400)
 
-    if name:
-        imam = frappe.get_doc("Imam", name)
-    else:
-        row = frappe.get_all(
-            "Imam", filters={"faithful": faithful}, fields=["name"], limit_page_length=1
-        )
-        if not row:
+    if not name:
+        name = _imam_for_faithful(faithful)
+        if not name:
             return _error(f"No Imam found for faithful {faithful}", 404, 404)
-        imam = frappe.get_doc("Imam", row[0].name)
 
-    data = imam.as_dict()
+    # — Imam row, profile fields and mosque name in one round-trip —
+    rows = frappe.db.sql(
+        """
+        SELECT i.*,
+            fp.full_name AS imam_name, fp.date_of_birth, fp.place_of_birth,
+            fp.gender, fp.marital_status, fp.phone, fp.email, fp.profile_image,
+            fp.national_id_number, fp.special_needs_proof,
+            m.mosque_name
+        FROM `tabImam` i
+        LEFT JOIN `tabFaithful Profile` fp ON fp.name = i.faithful
+        LEFT JOIN `tabMosque` m ON m.name = i.mosque_assigned
+        WHERE i.name = %s
+        """,
+        (name,),
+        as_dict=True,
+    )
+    if not rows:
+        return _error(f"Imam {name} not found", 404, 404)
+
+    data = rows[0]
+
+    # — Flat child-table lists —
+    data["teaching_subjects"] = _imam_child_rows(name, "teaching_subjects", pluck="subject")
+    data["expertise"] = _imam_child_rows(name, "expertise", pluck="area")
+    data["languages"] = _imam_child_rows(name, "languages", pluck="language")
+
+    # — Certifications (trimmed) —
+    data["certifications"] = _imam_child_rows(
+        name,
+        "certifications",
+        ["idx", "certification_name", "issuing_body", "date_awarded", "attachment"],
+    )
+
+    return _response(data)
+
+
+def _serialize_imam(doc):
+    """Same shape as get_imam, built from an Imam doc that is already loaded."""
+    data = doc.as_dict()
 
-    # — Profile fields —
     prof = (
         frappe.db.get_value(
             "Faithful Profile",
-            imam.faithful,
-            [
-                "full_name",
-                "date_of_birth",
-                "place_of_birth",
-                "gender",
-                "marital_status",
-                "phone",
-                "email",
-                "profile_image",
-                "national_id_number",
-                "special_needs_proof",
-            ],
+            doc.faithful,
+            list(PROFILE_FIELDS),
             as_dict=1,
         )
-        or {}
-    )
-    data.update(
-        {
-            "imam_name": prof.get("full_name"),
-            "date_of_birth": prof.get("date_of_birth"),
-            "place_of_birth": prof.get("place_of_birth"),
-            "gender": prof.get("gender"),
-            "marital_status": prof.get("marital_status"),
-            "phone": prof.get("phone"),
-            "email": prof.get("email"),
-            "profile_image": prof.get("profile_image"),
-            "national_id_number": prof.get("national_id_number"),
-            "special_needs_proof": prof.get("special_needs_proof"),
-        }
-    )
-
-    # — Mosque display name —
-    mosque_id = data.get("mosque_assigned")
+        if doc.faithful
+        else None
+    ) or {}
+    data.update(prof)
+    data["imam_name"] = data.pop("full_name", None)
     data["mosque_name"] = (
-        frappe.db.get_value("Mosque", mosque_id, "mosque_name") if mosque_id else None
+        _mosque_names([doc.mosque_assigned])[doc.mosque_assigned]
+        if doc.mosque_assigned
+        else None
     )
 
-    # — Flat child-table lists —
-    data["teaching_subjects"] = [d.subject for d in imam.get("teaching_subjects", [])]
-    data["expertise"] = [d.area for d in imam.get("expertise", [])]
-    data["languages"] = [d.language for d in imam.get("languages", [])]
-
-    # — Certifications (trimmed) —
+    data["teaching_subjects"] = [d.subject for d in doc.get("teaching_subjects", [])]
+    data["expertise"] = [d.area for d in doc.get("expertise", [])]
+    data["languages"] = [d.language for d in doc.get("languages", [])]
     data["certifications"] = [
         {
             "idx": cert.idx,
@@ -222,10 +344,24 @@ def get_imam(name=None, faithful=None):
             "date_awarded": cert.date_awarded,
             "attachment": cert.attachment,
         }
-        for cert in imam.get("certifications", [])
+        for cert in doc.get("certifications", [])
     ]
+    return data
 
-    return _response(data)
+
+def _imam_child_rows(parent, parentfield, fields=None, pluck=None):
+    """Read only the needed columns of one Imam child table, without get_doc.
+
+    With `pluck`, returns a flat list of that column's values.
+    """
+    child_doctype = frappe.get_meta("Imam").get_field(parentfield).options
+    return frappe.get_all(
+        child_doctype,
+        filters={"parent": parent, "parenttype": "Imam", "parentfield": parentfield},
+        fields=fields or [pluck],
+        pluck=pluck,
+        order_by="idx",
+    )
 
 
 # ——————————————————————————————————————————————————————————————
@@ -237,14 +373,18 @@ def get_imam(name=None, faithful=None):
 def register_imam():
     """POST JSON { data: { faithful, mosque, date_appointed, … } }"""
     payload = frappe.local.request.get_json().get("data", {})
-    for field in ("faithful", "mosque_assigned", "date_appointed"):
+    for field in IMAM_REQUIRED_FIELDS:
         if not payload.get(field):
             return _error(f"Missing required field `{field}`", 400, 400)
     try:
         doc = frappe.get_doc({"doctype": "Imam", **payload}).insert(
             ignore_permissions=True
         )
-        return get_imam(name=doc.name)
+        return _response(_serialize_imam(doc))
+    except frappe.DuplicateEntryError as e:
+        return _error("Imam already exists", 409, 409, {"description": str(e)})
+    except frappe.ValidationError as e:
+        return _error("Failed to create Imam", 400, 400, {"description": str(e)})
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "register_imam")
         return _error("Failed to create Imam", 500, 500, {"description": str(e)})
@@ -264,34 +404,50 @@ def update_imam():
         # Handle certifications
         certifications = payload.pop("certifications", [])
         if certifications:
-            doc.set("certifications", [])  # Clear existing
+            # Decode and write base64 attachments in parallel (b64decode and file IO release the GIL);
+            # the File docs are inserted afterwards on this thread, which owns the DB connection.
+            uploads = [
+                cert
+                for cert in certifications
+                if (cert.get("attachment") or "").startswith("data:")
+            ]
+            if uploads:
+                try:
+                    files_path = get_files_path()
+                    with ThreadPoolExecutor(max_workers=min(4, len(uploads))) as ex:
+                        filenames = list(
+                            ex.map(
+                                lambda c: _write_base64_file(c["attachment"], files_path),
+                                uploads,
+                            )
+                        )
+                    for cert, filename in zip(uploads, filenames, strict=True):
+                        cert["attachment"] = _insert_file_doc(filename, "Imam", name)
+                except Exception as e:
+                    frappe.log_error(frappe.get_traceback(), "save_base64_file")
+                    return _error(
+                        "Attachment upload failed",
+                        400,
+                        400,
+                        {"description": str(e)},
+                    )
 
             for cert in certifications:
-                attachment = cert.get("attachment")
-
-                if attachment and attachment.startswith("data:"):
-                    try:
-                        attachment_url = save_base64_file(attachment, "Imam", name)
-                        cert["attachment"] = attachment_url
-                    except Exception as e:
-                        return _error(
-                            "Attachment upload failed",
-                            400,
-                            400,
-                            {"description": str(e)},
-                        )
-                elif not attachment:
+                if not cert.get("attachment"):
                     cert["attachment"] = None
 
-                doc.append("certifications", cert)
+            # Replace the child table in one go rather than clear + append per row
+            doc.set("certifications", certifications)
 
         # Update other fields
         doc.update(payload)
         doc.save(ignore_permissions=True)
-        return get_imam(name=doc.name)
+        return _response(_serialize_imam(doc))
 
     except frappe.DoesNotExistError:
         return _error("Imam not found", 404, 404)
+    except frappe.ValidationError as e:
+        return _error("Failed to update Imam", 400, 400, {"description": str(e)})
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "update_imam")
         return _error("Failed to update Imam", 500, 500, {"description": str(e)})
@@ -322,24 +478,104 @@ def delete_imam(name=None):
 @frappe.whitelist(allow_guest=True, methods=["POST"])
 def bulk_upload_imams():
     """Upload an Excel with columns: faithful, mosque, date_appointed, …"""
+    # Imported here so the other Imam/Mosque routes don't load openpyxl
+    from openpyxl import load_workbook
+
     try:
         file = frappe.request.files.get("file")
         if not file:
             raise frappe.ValidationError("No file uploaded under 'file'")
-        df = pd.read_excel(file)
-        summary = {"total": len(df), "created": 0, "failed": 0}
+        # Stream the sheet row by row instead of building a DataFrame
+        wb = load_workbook(file.stream, read_only=True, data_only=True)
+        rows = wb.active.iter_rows(values_only=True)
+        headers = next(rows, None) or ()
+        summary = {"total": 0, "created": 0, "failed": 0}
         errors = []
-        for idx, row in df.iterrows():
-            data = row.to_dict()
-            data.pop("name", None)
+
+        timestamp, user = now(), frappe.session.user
+        docs = []  # (row_no, row dict) pairs waiting for the next flush
+
+        def flush():
+            # bulk_insert doesn't validate Links; check the batch's ids with one IN query per doctype
+            for field, doctype in IMAM_LINK_FIELDS:
+                ids = list({d[field] for _, d in docs})
+                if not ids:
+                    continue
+                found = set(frappe.get_all(doctype, filters={"name": ["in", ids]}, pluck="name"))
+                kept = []
+                for row_no, d in docs:
+                    if d[field] in found:
+                        kept.append((row_no, d))
+                    else:
+                        summary["failed"] += 1
+                        errors.append({"row": row_no, "error": f"Could not find {doctype}: {d[field]}"})
+                docs[:] = kept
+
+            # One multi-row INSERT per batch instead of an ORM insert per row
+            if docs:
+                fields = list(docs[0][1])
+                batch_point = f"imam_batch_{docs[0][0]}"
+                frappe.db.savepoint(batch_point)
+                try:
+                    frappe.db.bulk_insert(
+                        "Imam",
+                        fields=fields,
+                        values=[tuple(d.values()) for _, d in docs],
+                    )
+                    summary["created"] += len(docs)
+                except Exception:
+                    # One bad row fails the whole INSERT; retry row by row to report just that row
+                    frappe.db.rollback(save_point=batch_point)
+                    for row_no, d in docs:
+                        row_point = f"imam_insert_{row_no}"
+                        frappe.db.savepoint(row_point)
+                        try:
+                            frappe.db.bulk_insert(
+                                "Imam", fields=fields, values=[tuple(d.values())]
+                            )
+                            summary["created"] += 1
+                        except Exception as e:
+                            frappe.db.rollback(save_point=row_point)
+                            summary["failed"] += 1
+                            errors.append({"row": row_no, "error": str(e)})
+                docs.clear()
+            frappe.db.commit()
+
+        for row_no, values in enumerate(rows, start=2):
+            if all(v is None for v in values):
+                continue
+            summary["total"] += 1
+            data = {h: v for h, v in zip(headers, values, strict=False) if h and h != "name"}
+            save_point = f"imam_row_{row_no}"
+            frappe.db.savepoint(save_point)
             try:
-                frappe.get_doc({"doctype": "Imam", **data}).insert(
-                    ignore_permissions=True
-                )
-                summary["created"] += 1
+                if not all(data.get(f) for f in IMAM_REQUIRED_FIELDS):
+                    # Slow path: let the full insert report what is wrong
+                    frappe.get_doc({"doctype": "Imam", **data}).insert(
+                        ignore_permissions=True
+                    )
+                    summary["created"] += 1
+                else:
+                    doc = frappe.new_doc("Imam")
+                    doc.update(data)
+                    doc.set_new_name()
+                    doc.creation = doc.modified = timestamp
+                    doc.owner = doc.modified_by = user
+                    docs.append((row_no, doc.get_valid_dict(convert_dates_to_str=True)))
             except Exception as e:
+                frappe.db.rollback(save_point=save_point)
                 summary["failed"] += 1
-                errors.append({"row": idx + 2, "error": str(e)})
+                errors.append({"row": row_no, "error": str(e)})
+
+            if summary["total"] % BULK_COMMIT_SIZE == 0:
+                flush()
+        wb.close()
+        flush()
+
+        if summary["created"]:
+            # bulk_insert skips doc_events, so drop the cached mosque reads (they embed imams)
+            frappe.get_attr("faithful_registration.api.mosque.clear_mosque_cache")()
+
         return _response(
             {"summary": summary, "errors": errors}, 200, "Bulk upload finished"
         )
@@ -385,6 +621,10 @@ def reassign_imam():
             }
         ).insert(ignore_permissions=True)
         return _response(imam.as_dict(), 200, "Imam reassigned")
+    except frappe.DoesNotExistError:
+        return _error("Imam not found", 404, 404)
+    except frappe.ValidationError as e:
+        return _error("Failed to reassign Imam", 400, 400, {"description": str(e)})
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "reassign_imam")
         return _error("Failed to reassign Imam", 500, 500, {"description": str(e)})
@@ -392,34 +632,41 @@ def reassign_imam():
 
 def save_base64_file(data_url, doctype, docname):
     try:
-        match = re.match(r"data:(.*?);base64,(.*)", data_url)
-        if not match:
-            raise ValueError("Invalid base64 format")
+        filename = _write_base64_file(data_url, get_files_path())
+        return _insert_file_doc(filename, doctype, docname)
+    except Exception as e:
+        frappe.log_error(frappe.get_traceback(), "save_base64_file")
+        raise
 
-        mime_type, encoded = match.groups()
-        ext = mime_type.split("/")[-1] or "bin"
-        filedata = base64.b64decode(encoded)
-        filename = f"imam_cert_{uuid.uuid4().hex[:8]}.{ext}"
 
-        filepath = os.path.join(get_files_path(), filename)
-        with open(filepath, "wb") as f:
-            f.write(filedata)
+def _write_base64_file(data_url, files_path):
+    """Decode a data URL and write it under files_path; touches no frappe state, so it is thread-safe."""
+    match = _DATA_URL_RE.match(data_url)
+    if not match:
+        raise ValueError("Invalid base64 format")
 
-        file_doc = frappe.get_doc(
-            {
-                "doctype": "File",
-                "file_name": filename,
-                "file_url": f"/files/{filename}",
-                "is_private": 0,
-                "attached_to_doctype": doctype,
-                "attached_to_name": docname,
-            }
-        )
-        file_doc.insert(ignore_permissions=True)
+    mime_type, encoded = match.groups()
+    ext = mime_type.split("/")[-1] or "bin"
+    filedata = base64.b64decode(encoded, validate=False)
+    filename = f"imam_cert_{uuid.uuid4().hex[:8]}.{ext}"
 
-        return file_doc.file_url
+    with open(os.path.join(files_path, filename), "wb") as f:
+        f.write(filedata)
 
-    except Exception as e:
-        frappe.log_error(frappe.get_traceback(), "save_base64_file")
-        raise
+    return filename
+
+
+def _insert_file_doc(filename, doctype, docname):
+    file_doc = frappe.get_doc(
+        {
+            "doctype": "File",
+            "file_name": filename,
+            "file_url": f"/files/{filename}",
+            "is_private": 0,
+            "attached_to_doctype": doctype,
+            "attached_to_name": docname,
+        }
+    )
+    file_doc.insert(ignore_permissions=True)
 
+    return file_doc.file_url
@@ -1,25 +1,54 @@
 import frappe
-from frappe.utils import now,get_files_path
+from frappe.core.api.file import get_max_file_size
+from frappe.model import default_fields
+from frappe.utils import cint, now,get_files_path
+from frappe.utils.background_jobs import get_job
+from frappe.utils.synchronization import filelock
 import uuid
-from werkzeug.wrappers import Response
-import json
-import frappe
 from frappe import _
-import pandas as pd
-from io import BytesIO
-import base64, re, os
-def safe_date(val):
-    return val.isoformat() if hasattr(val, "isoformat") else val
+from faithful_registration.api.imam import MAX_PAGE_SIZE, _response, _error
+import base64, csv, re, os, secrets, zipfile
+
+MOSQUE_CACHE_PREFIX = "mosques:"
+MOSQUE_LIST_CACHE_KEY = f"{MOSQUE_CACHE_PREFIX}all"
+BULK_INSERT_CHUNK_SIZE = 10_000
+BULK_LOCK_TIMEOUT = 1800  # longest a queued upload waits for the one ahead of it
+BULK_IMPORT_TIMEOUT = 1800  # time budget for the import itself
+BULK_RESULT_TTL = 7 * 24 * 3600  # how long get_bulk_status can report a finished upload
+_B64_WINDOW = 1 << 16  # base64 chars per decode step; a multiple of 4 so windows split on whole quanta
+_B64_JUNK_RE = re.compile(r"[^A-Za-z0-9+/=]")
+_IMAGE_FIELDS = ("front_image", "back_image", "madrasa_image", "inside_image", "ceiling_image", "minbar_image")
+
+def _ctx():
+    """(request_id, timestamp) for the current request, computed once and kept on frappe.local."""
+    ctx = getattr(frappe.local, "mosque_api_ctx", None)
+    if ctx is None:
+        ctx = frappe.local.mosque_api_ctx = (uuid.uuid4().hex, now())
+    return ctx
+
+def _meta():
+    """Envelope meta for one response; the rest of the envelope is built by _response."""
+    request_id, timestamp = _ctx()
+    return {"request_id": request_id, "timestamp": timestamp}
+
+def clear_mosque_cache(doc=None, method=None):
+    """doc_events hook: Mosque, Imam and Faithful Profile changes invalidate the cached mosque reads."""
+    frappe.cache().delete_keys(MOSQUE_CACHE_PREFIX)
 
 @frappe.whitelist(allow_guest=True, methods=["POST"])
 def bulk_register_mosques():
     """
     Upload an Excel file to register multiple mosques in bulk.
     Each row must contain at least the 'mosque_name'.
+    The rows are processed in a background job; poll get_bulk_status with the returned job_id.
     """
+    # openpyxl is only needed here and in the worker; keep it out of every other route's import
+    from io import BytesIO
 
-    request_id = str(uuid.uuid4())
-    timestamp = now()
+    from openpyxl import load_workbook
+
+    meta = _meta()
+    request_id = meta["request_id"]
 
     try:
         # Step 1: Receive the uploaded file
@@ -27,130 +56,335 @@ def bulk_register_mosques():
         if not file:
             raise frappe.ValidationError("No file uploaded. Expecting an Excel file.")
 
-        df = pd.read_excel(BytesIO(file.read()))
-        if "mosque_name" not in df.columns:
+        # Read in 1MB chunks so an oversized upload is rejected before it is fully buffered.
+        # The cap is the site's File size limit, which upload.save() below enforces anyway.
+        max_bytes = get_max_file_size()
+        content = bytearray()
+        while chunk := file.stream.read(1 << 20):
+            content.extend(chunk)
+            if len(content) > max_bytes:
+                raise frappe.ValidationError(f"File too large. Maximum size is {max_bytes // (1 << 20)}MB.")
+        content = bytes(content)
+        if not zipfile.is_zipfile(BytesIO(content)):
+            raise frappe.ValidationError("Invalid file. Expecting an .xlsx Excel file.")
+
+        # Check the header row now so a bad sheet is rejected before it is queued
+        wb = load_workbook(BytesIO(content), read_only=True, data_only=True)
+        headers = next(wb.active.iter_rows(max_row=1, values_only=True), None) or ()
+        wb.close()
+        if "mosque_name" not in headers:
             raise frappe.ValidationError("Missing required column: 'mosque_name'")
 
-        total_records = len(df)
+        # Keep the upload as a private File so the worker can read it
+        upload = frappe.get_doc({
+            "doctype": "File",
+            "file_name": f"mosque_upload_{request_id}.xlsx",
+            "is_private": 1,
+            "content": content
+        })
+        upload.save(ignore_permissions=True)
+
+        frappe.enqueue(
+            "faithful_registration.api.mosque._bulk_register_worker",
+            queue="long",
+            # Waiting on the lock counts against the RQ timeout, so budget for both
+            timeout=BULK_LOCK_TIMEOUT + BULK_IMPORT_TIMEOUT,
+            job_id=_bulk_job_id(request_id),
+            enqueue_after_commit=True,
+            file_name=upload.name,
+            request_id=request_id
+        )
+
+        return _response(
+            {"job_id": request_id, "status": "accepted"},
+            202,
+            "Bulk mosque upload queued.",
+            code=202,
+            meta=meta
+        )
+
+    except frappe.ValidationError as e:
+        return _error("Bulk mosque upload failed.", 400, 400, {"description": str(e)}, meta)
+
+    except Exception as e:
+        frappe.log_error(frappe.get_traceback(), "Bulk Register Mosques Failed")
+
+        return _error("Bulk mosque upload failed.", 500, 500, {"description": str(e)}, meta)
+
+def _bulk_job_id(request_id):
+    return f"bulk_mosques:{request_id}"
+
+def _bulk_result_key(request_id):
+    # Not under MOSQUE_CACHE_PREFIX, so clear_mosque_cache leaves finished summaries alone
+    return f"{_bulk_job_id(request_id)}:result"
+
+def _bulk_register_worker(file_name, request_id):
+    """Background job for bulk_register_mosques; the summary is kept in cache for get_bulk_status."""
+    # One upload is ingested at a time, so concurrent jobs queue here instead of contending for the writer
+    with filelock("mosque_bulk_upload", timeout=BULK_LOCK_TIMEOUT):
+        summary = _bulk_register(file_name)
+    # RQ drops job results after a few minutes; the summary and failed file link must outlive that
+    frappe.cache().set_value(_bulk_result_key(request_id), summary, expires_in_sec=BULK_RESULT_TTL)
+    return summary
+
+def _bulk_register(file_name):
+    from openpyxl import load_workbook
+
+    timestamp = now()
+    try:
+        upload = frappe.get_doc("File", file_name)
+        # Stream the sheet row by row instead of materialising a DataFrame
+        # Open the stored file by path so openpyxl reads it lazily from disk
+        wb = load_workbook(upload.get_full_path(), read_only=True, data_only=True)
+        rows = wb.active.iter_rows(values_only=True)
+        headers = next(rows, None) or ()
+
+        # Resolve the usable columns once; headers that are not Mosque columns are dropped here, not per row.
+        # name and the audit columns are never taken from the sheet, so a row can't overwrite the stamps.
+        mosque_meta = frappe.get_meta("Mosque")
+        valid_columns = set(mosque_meta.get_valid_columns()).difference(default_fields)
+        columns = [h if h in valid_columns else None for h in headers]
+
+        def read_chunks():
+            # Only one chunk of rows is held in memory at a time
+            chunk = []
+            for values in rows:
+                if all(v is None for v in values):
+                    continue
+                record = {h: v for h, v in zip(columns, values, strict=False) if h and v is not None}
+                record["mosque_name"] = str(record.get("mosque_name", "")).strip()
+                for key in ("contact_email", "contact_phone"):
+                    if key in record:
+                        record[key] = str(record[key]).strip() or None
+                chunk.append(record)
+                if len(chunk) >= BULK_INSERT_CHUNK_SIZE:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+        total_records = 0
         created = 0
         duplicates = 0
         failed = 0
-        failed_records = []
-
-        for i, row in df.iterrows():
-            try:
-                mosque_name = str(row.get("mosque_name")).strip()
-                if not mosque_name:
-                    raise frappe.ValidationError("Mosque name is required.")
-
-                email = str(row.get("contact_email")).strip() if pd.notna(row.get("contact_email")) else None
-                phone = str(row.get("contact_phone")).strip() if pd.notna(row.get("contact_phone")) else None
-
-                # Check for duplicates by name
-                if frappe.db.exists("Mosque", {"mosque_name": mosque_name}):
-                    duplicates += 1
-                    failed_records.append({
-                        "mosque_name": mosque_name,
-                        "error": "Duplicate mosque name"
-                    })
-                    continue
+        # Failed rows kept as two parallel lists rather than a dict per row
+        fail_names, fail_errors = [], []
 
-                # Check for duplicates by email
-                if email and frappe.db.exists("Mosque", {"contact_email": email}):
-                    duplicates += 1
-                    failed_records.append({
-                        "mosque_name": mosque_name,
-                        "error": f"Duplicate contact email: {email}"
-                    })
-                    continue
+        user = frappe.session.user
+        # Defaults and audit fields are the same for every row, so build them once
+        template = frappe.new_doc("Mosque").get_valid_dict(convert_dates_to_str=True)
+        template.update(creation=timestamp, modified=timestamp, owner=user, modified_by=user)
+        namer = _bulk_namer(mosque_meta)
 
-                # Check for duplicates by phone
-                if phone and frappe.db.exists("Mosque", {"contact_phone": phone}):
-                    duplicates += 1
-                    failed_records.append({
-                        "mosque_name": mosque_name,
-                        "error": f"Duplicate contact phone: {phone}"
-                    })
-                    continue
+        pending = []
 
-                # Create document
-                doc = frappe.new_doc("Mosque")
-                for col in df.columns:
-                    value = row.get(col)
-                    if pd.notna(value):
-                        doc.set(col, value)
-
-                doc.insert(ignore_permissions=True)
-                created += 1
-
-            except Exception as e:
-                failed += 1
-                failed_records.append({
-                    "mosque_name": row.get("mosque_name", "Unknown"),
-                    "error": str(e)
-                })
+        def log_failure():
+            # Failures are summarised in one Error Log after the loop; tracebacks only in developer mode
+            if frappe.conf.developer_mode:
                 frappe.log_error(frappe.get_traceback(), "Bulk Mosque Upload Error")
 
+        def flush():
+            # One multi-row INSERT and one COMMIT per chunk instead of a full doc.insert() per row
+            nonlocal created, failed
+            if not pending:
+                return
+            fields = list(pending[0])
+            save_point = f"mosque_chunk_{total_records}"
+            frappe.db.savepoint(save_point)
+            try:
+                frappe.db.bulk_insert(
+                    "Mosque",
+                    fields=fields,
+                    values=(tuple(d.values()) for d in pending),
+                    chunk_size=BULK_INSERT_CHUNK_SIZE
+                )
+                created += len(pending)
+            except Exception:
+                # One bad row fails the whole INSERT; roll it back and retry row by row
+                # so only the offending rows are reported
+                frappe.db.rollback(save_point=save_point)
+                for i, d in enumerate(pending):
+                    row_point = f"mosque_row_{total_records}_{i}"
+                    frappe.db.savepoint(row_point)
+                    try:
+                        frappe.db.bulk_insert("Mosque", fields=fields, values=[tuple(d.values())])
+                        created += 1
+                    except Exception as e:
+                        frappe.db.rollback(save_point=row_point)
+                        failed += 1
+                        fail_names.append(d.get("mosque_name"))
+                        fail_errors.append(str(e))
+                        log_failure()
+            pending.clear()
+            frappe.db.commit()
+
+        def existing(field, chunk):
+            keys = list({values[field] for values in chunk if values.get(field)})
+            if not keys:
+                return set()
+            return set(frappe.get_all("Mosque", filters={field: ["in", keys]}, pluck=field))
+
+        frappe.db.begin()
+        for chunk in read_chunks():
+            # Look up the names and contacts already registered with one query each per chunk
+            existing_names = existing("mosque_name", chunk)
+            existing_emails = existing("contact_email", chunk)
+            existing_phones = existing("contact_phone", chunk)
+            # Earlier chunks are committed and so covered by the lookups above;
+            # only repeats inside this chunk need tracking, which keeps these sets bounded
+            seen_names, seen_emails, seen_phones = set(), set(), set()
+
+            for values in chunk:
+                total_records += 1
+                try:
+                    mosque_name = values["mosque_name"]
+                    if not mosque_name:
+                        raise frappe.ValidationError("Mosque name is required.")
+
+                    email = values.get("contact_email")
+                    phone = values.get("contact_phone")
+
+                    # Repeats within the file are rejected here, before any database check
+                    if mosque_name in seen_names:
+                        duplicates += 1
+                        fail_names.append(mosque_name)
+                        fail_errors.append("In-batch duplicate")
+                        continue
+
+                    # Check for duplicates by name
+                    if mosque_name in existing_names:
+                        duplicates += 1
+                        fail_names.append(mosque_name)
+                        fail_errors.append("Duplicate mosque name")
+                        continue
+
+                    # Check for duplicates by email
+                    if email and (email in seen_emails or email in existing_emails):
+                        duplicates += 1
+                        fail_names.append(mosque_name)
+                        fail_errors.append(f"Duplicate contact email: {email}")
+                        continue
+
+                    # Check for duplicates by phone
+                    if phone and (phone in seen_phones or phone in existing_phones):
+                        duplicates += 1
+                        fail_names.append(mosque_name)
+                        fail_errors.append(f"Duplicate contact phone: {phone}")
+                        continue
+
+                    # Fast path: plain row straight onto the template when naming needs no controller
+                    name = namer(values) if namer else None
+                    if name:
+                        pending.append({**template, **values, "name": name})
+                    else:
+                        doc = frappe.new_doc("Mosque")
+                        doc.update(values)
+                        doc.set_new_name()
+                        doc.creation = doc.modified = timestamp
+                        doc.owner = doc.modified_by = user
+                        pending.append(doc.get_valid_dict(convert_dates_to_str=True))
+
+                    # Only accepted rows count as seen, so a rejected row doesn't block a later one
+                    seen_names.add(mosque_name)
+                    if email:
+                        seen_emails.add(email)
+                    if phone:
+                        seen_phones.add(phone)
+
+                except Exception as e:
+                    failed += 1
+                    fail_names.append(values.get("mosque_name") or "Unknown")
+                    fail_errors.append(str(e))
+                    log_failure()
+
+            flush()
+        wb.close()
+
+        if failed:
+            frappe.log_error(
+                frappe.as_json([
+                    {"mosque_name": n, "error": e} for n, e in zip(fail_names[:50], fail_errors[:50], strict=True)
+                ]),
+                "Bulk Mosque Upload Errors"
+            )
+
+        if created:
+            clear_mosque_cache()  # bulk_insert skips doc_events
+
         # Prepare failed record export (if needed)
         failed_file_url = None
-        if failed_records:
-            failed_df = pd.DataFrame(failed_records)
-            output = BytesIO()
-            failed_df.to_excel(output, index=False)
-            output.seek(0)
-
-            # Save as private file in Frappe
+        if fail_names:
+            # Stream the rows as CSV straight into the private files folder, no in-memory copy
+            failed_name = f"failed_mosques_{frappe.generate_hash(length=10)}.csv"
+            with open(frappe.get_site_path("private", "files", failed_name), "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["mosque_name", "error"])
+                writer.writerows(zip(fail_names, fail_errors, strict=True))
+
+            # Register it as a private file in Frappe
             file_doc = frappe.get_doc({
                 "doctype": "File",
-                "file_name": f"failed_mosques_{timestamp}.xlsx",
-                "is_private": 1,
-                "content": output.read()
+                "file_name": failed_name,
+                "file_url": f"/private/files/{failed_name}",
+                "is_private": 1
             })
             file_doc.save(ignore_permissions=True)
             failed_file_url = file_doc.file_url
 
-        response = {
-            "data": {
-                "total": total_records,
-                "created": created,
-                "duplicates": duplicates,
-                "failed": failed,
-                "failed_file_url": failed_file_url
-            },
-            "status": "success",
-            "code": 200,
-            "message": f"Processed {total_records} records. Created: {created}, Duplicates: {duplicates}, Failed: {failed}.",
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
+        return {
+            "total": total_records,
+            "created": created,
+            "duplicates": duplicates,
+            "failed": failed,
+            "failed_file_url": failed_file_url
         }
+    finally:
+        frappe.delete_doc("File", file_name, ignore_permissions=True, force=True)
+        frappe.db.commit()
+
+def _bulk_namer(meta):
+    """Name Mosque rows without building a Document, or None when naming needs the controller."""
+    if hasattr(frappe.get_controller("Mosque"), "autoname"):
+        return None
+    autoname = (meta.autoname or "").strip()
+    if autoname.lower() in ("", "hash"):
+        return lambda values: frappe.generate_hash(length=10)
+    if autoname.startswith("field:"):
+        fieldname = autoname.split(":", 1)[1].strip()
+        return lambda values: values.get(fieldname)
+    return None
 
-        return Response(json.dumps(response), status=200, content_type="application/json")
+@frappe.whitelist(allow_guest=True)
+def get_bulk_status(job_id=None):
+    """Report the state of a bulk_register_mosques job and, once finished, its summary."""
 
-    except Exception as e:
-        frappe.log_error(frappe.get_traceback(), "Bulk Register Mosques Failed")
+    meta = _meta()
 
-        error = {
-            "data": None,
-            "status": "error",
-            "code": 500,
-            "message": "Bulk mosque upload failed.",
-            "errors": {
-                "description": str(e)
-            },
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
-        return Response(json.dumps(error), status=500, content_type="application/json")
+    if not job_id:
+        return _error("Missing `job_id`", 400, 400, meta=meta)
+
+    result = frappe.cache().get_value(_bulk_result_key(job_id))
+    if result is not None:
+        data = {"job_id": job_id, "status": "finished", "result": result}
+        return _response(data, 200, "Bulk upload status fetched.", code=200, meta=meta)
+
+    job = get_job(_bulk_job_id(job_id))
+    if not job:
+        return _error("Bulk upload job not found.", 404, 404, meta=meta)
+
+    status = job.get_status()
+    data = {"job_id": job_id, "status": status, "result": None}
+    if status == "finished":
+        data["result"] = job.return_value()
+    elif status == "failed":
+        data["error"] = (job.exc_info or "").strip().splitlines()[-1:]
+
+    return _response(data, 200, "Bulk upload status fetched.", code=200, meta=meta)
 
 @frappe.whitelist(allow_guest=True)
 def register_mosque():
     """Create a new Mosque via API"""
-    request_id = str(uuid.uuid4())
-    timestamp = now()
+    meta = _meta()
 
     try:
         data = frappe.local.request.get_json()
@@ -166,208 +400,191 @@ def register_mosque():
         email = payload.get("contact_email")
         phone = payload.get("contact_phone")
 
-        if email and frappe.db.exists("Mosque", {"contact_email": email}):
-            raise frappe.ValidationError(f"Email `{email}` is already in use.")
-
-        if phone and frappe.db.exists("Mosque", {"contact_phone": phone}):
-            raise frappe.ValidationError(f"Phone `{phone}` is already in use.")
+        _check_contact_conflict(email, phone)
 
         # Handle base64 images
-        for field in ["front_image", "back_image", "madrasa_image", "inside_image", "ceiling_image", "minbar_image"]:
-            img = payload.get(field)
-            if img and img.startswith("data:"):
-                filename = f"{field}_{uuid.uuid4().hex}.jpg"
-                payload[field] = save_base64_file(img, filename)
+        _save_images(payload)
 
         doc = frappe.new_doc("Mosque")
         doc.update(payload)
         doc.insert(ignore_permissions=True)
 
-        response = {
-            "data": {k: safe_date(v) for k, v in doc.as_dict().items()},
-            "status": "success",
-            "code": 201,
-            "message": "Mosque registered successfully.",
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
+        return _response(
+            doc.as_dict(),
+            201,
+            "Mosque registered successfully.",
+            code=201,
+            meta=meta
+        )
 
-        return Response(json.dumps(response), status=201, content_type="application/json")
+    except frappe.ValidationError as e:
+        return _error("Failed to register mosque.", 400, 400, {"description": str(e)}, meta)
 
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Mosque Registration Failed")
-        error = {
-            "data": None,
-            "status": "error",
-            "code": 400,
-            "message": "Failed to register mosque.",
-            "errors": {
-                "description": str(e)
-            },
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
-        return Response(json.dumps(error), status=400, content_type="application/json")
+        return _error("Failed to register mosque.", 400, 400, {"description": str(e)}, meta)
+
+def _check_contact_conflict(email, phone, exclude=None):
+    """Raise if another Mosque already uses this email or phone; one query covers both."""
+    if not (email or phone):
+        return
+    conflict = frappe.db.sql(
+        """
+        SELECT contact_email = %(email)s AS email_hit FROM `tabMosque`
+        WHERE (contact_email = %(email)s OR contact_phone = %(phone)s) AND name != %(name)s
+        ORDER BY email_hit DESC
+        LIMIT 1
+        """,
+        # Empty strings become NULL so they match nothing (`= NULL` is never true)
+        {"email": email or None, "phone": phone or None, "name": exclude or ""},
+        as_dict=True
+    )
+    if not conflict:
+        return
+    # Which column matched is decided by the database, under the same collation as the WHERE
+    if conflict[0].email_hit:
+        raise frappe.ValidationError(f"Email `{email}` is already in use.")
+    raise frappe.ValidationError(f"Phone `{phone}` is already in use.")
+
+def _attach_imams(records):
+    """Add head_imam_name/head_imam_image and the `imams` list to Mosque rows with two queries in total."""
+    if not records:
+        return
+    mosque_ids = [r["name"] for r in records]
+    head_imam_ids = [r["head_imam"] for r in records if r.get("head_imam")]
+
+    or_filters = [["mosque_assigned", "in", mosque_ids]]
+    if head_imam_ids:
+        or_filters.append(["name", "in", head_imam_ids])
+    imams = frappe.get_all(
+        "Imam",
+        or_filters=or_filters,
+        fields=["name", "mosque_assigned", "role_in_mosque", "faithful"]
+    )
+
+    faithful_ids = list({i["faithful"] for i in imams if i["faithful"]})
+    profiles = {
+        p["name"]: p for p in frappe.get_all(
+            "Faithful Profile",
+            filters={"name": ["in", faithful_ids]},
+            fields=["name", "full_name", "profile_image"]
+        )
+    } if faithful_ids else {}
+
+    imams_by_name = {i["name"]: i for i in imams}
+    imams_by_mosque = {}
+    for imam in imams:
+        imams_by_mosque.setdefault(imam["mosque_assigned"], []).append({
+            "name": imam["name"],
+            "role_in_mosque": imam["role_in_mosque"],
+            "imam_name": profiles.get(imam["faithful"], {}).get("full_name")
+        })
+
+    for r in records:
+        head = imams_by_name.get(r.get("head_imam"))
+        if head and head["faithful"]:
+            profile = profiles.get(head["faithful"], {})
+            r["head_imam_name"] = profile.get("full_name")
+            r["head_imam_image"] = profile.get("profile_image")
+        r["imams"] = imams_by_mosque.get(r["name"], [])
+
+def _mosque_list_sql():
+    """SELECT over every Mosque column with Date/Datetime columns rendered as ISO strings by DATE_FORMAT."""
+    meta = frappe.get_meta("Mosque")
+    columns = []
+    for column in meta.get_valid_columns():
+        field = meta.get_field(column)
+        fieldtype = field.fieldtype if field else ("Datetime" if column in ("creation", "modified") else None)
+        if fieldtype == "Date":
+            columns.append(f"DATE_FORMAT(`{column}`, '%%Y-%%m-%%d') AS `{column}`")
+        elif fieldtype == "Datetime":
+            columns.append(f"DATE_FORMAT(`{column}`, '%%Y-%%m-%%dT%%H:%%i:%%s.%%f') AS `{column}`")
+        else:
+            columns.append(f"`{column}`")
+    # name breaks creation ties; every row of one bulk upload shares a creation stamp
+    return (
+        f"SELECT {', '.join(columns)} FROM `tabMosque` {{where}} "
+        "ORDER BY `creation` DESC, `name` DESC LIMIT %(limit)s"
+    )
 
 @frappe.whitelist(allow_guest=True)
-def get_all_mosques():
-    """Retrieve all Mosque records (all fields)"""
-    request_id = str(uuid.uuid4())
-    timestamp = now()
+def get_all_mosques(limit=100, cursor=None):
+    """
+    Page through Mosque records (all fields) newest first; pass `cursor` = previous `next_cursor`.
+    The cursor is "<creation>|<name>" of the last row served.
+    """
+    meta = _meta()
 
     try:
-        # <-- pull in *all* fields -->
-        records = frappe.get_all(
-            "Mosque",
-            fields=["*"],
-            order_by="creation desc"
-        )
-
-        # convert dates to ISO and enrich with head_imam/imams
-        for r in records:
-            # normalize *every* field for dates
-            for key, val in list(r.items()):
-                r[key] = safe_date(val)
-
-            # head_imam lookup
-            if r.get("head_imam"):
-                faithful = frappe.db.get_value("Imam", r["head_imam"], "faithful")
-                if faithful:
-                    profile = frappe.db.get_value(
-                        "Faithful Profile", faithful,
-                        ["full_name", "profile_image"],
-                        as_dict=True
-                    ) or {}
-                    r["head_imam_name"]  = profile.get("full_name")
-                    r["head_imam_image"] = profile.get("profile_image")
-
-            # imams list
-            imams = frappe.get_all(
-                "Imam",
-                filters={"mosque_assigned": r["name"]},
-                fields=["name", "role_in_mosque"]
+        limit = min(max(cint(limit) or 100, 1), MAX_PAGE_SIZE)
+        cache_key = f"{MOSQUE_LIST_CACHE_KEY}:{limit}:{cursor or ''}"
+        records = frappe.cache().get_value(cache_key)
+        if records is None:
+            # <-- pull in *all* fields, dates already formatted by the database -->
+            after_creation, _sep, after_name = (cursor or "").partition("|")
+            where = (
+                "WHERE `creation` < %(creation)s OR (`creation` = %(creation)s AND `name` < %(name)s)"
+                if cursor else ""
+            )
+            records = frappe.db.sql(
+                _mosque_list_sql().format(where=where),
+                {"creation": after_creation, "name": after_name, "limit": limit},
+                as_dict=True
             )
-            for imam in imams:
-                faithful = frappe.db.get_value("Imam", imam["name"], "faithful")
-                imam["imam_name"] = frappe.db.get_value("Faithful Profile", faithful, "full_name")
-            r["imams"] = imams
 
-        return {
-            "data": records,
-            "status": "success",
-            "code": 200,
-            "message": _("Mosques retrieved successfully."),
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
+            # enrich with head_imam/imams; dates already arrive as ISO strings from _mosque_list_sql
+            _attach_imams(records)
+
+            frappe.cache().set_value(cache_key, records, expires_in_sec=300)
+
+        meta["limit"] = limit
+        meta["next_cursor"] = (
+            f"{records[-1]['creation']}|{records[-1]['name']}" if len(records) == limit else None
+        )
+        return _response(records, 200, _("Mosques retrieved successfully."), code=200, meta=meta)
 
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Get All Mosques Failed")
-        error = {
-            "data":   None,
-            "status": "error",
-            "code":   400,
-            "message":"Failed to retrieve mosques.",
-            "errors": {"description": str(e)},
-            "meta": {"request_id": request_id, "timestamp": timestamp}
-        }
-        return cors_response(error, status=400)
+        return _error("Failed to retrieve mosques.", 400, 400, {"description": str(e)}, meta)
 
 @frappe.whitelist(allow_guest=True)
 def get_mosque(name):
     """Retrieve one Mosque by name"""
-    request_id = str(uuid.uuid4())
-    timestamp = now()
+    meta = _meta()
 
     try:
-        doc = frappe.get_doc("Mosque", name)
-        doc_dict = doc.as_dict()
-        for key, value in doc_dict.items():
-            doc_dict[key] = safe_date(value)
-
-        # Head Imam Name & Profile Image
-        if doc.head_imam:
-            faithful = frappe.db.get_value("Imam", doc.head_imam, "faithful")
-            if faithful:
-                profile = frappe.db.get_value(
-                    "Faithful Profile",
-                    faithful,
-                    ["full_name", "profile_image"],
-                    as_dict=True
-                ) or {}
-                doc_dict["head_imam_name"] = profile.get("full_name")
-                doc_dict["head_imam_image"] = profile.get("profile_image")
-
-        # List of Imams assigned to this mosque
-        imams = frappe.get_all(
-            "Imam",
-            filters={"mosque_assigned": doc.name},
-            fields=["name", "role_in_mosque"]
-        )
-        for imam in imams:
-            faithful = frappe.db.get_value("Imam", imam["name"], "faithful")
-            imam["imam_name"] = frappe.db.get_value("Faithful Profile", faithful, "full_name")
-        doc_dict["imams"] = imams
-
-        response = {
-            "data": doc_dict,
-            "status": "success",
-            "code": 200,
-            "message": "Mosque retrieved successfully.",
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
+        cache_key = f"{MOSQUE_CACHE_PREFIX}one:{name}"
+        doc_dict = frappe.cache().get_value(cache_key)
+        if doc_dict is None:
+            # One row read; no Document or child-table materialisation
+            doc_dict = frappe.db.get_value("Mosque", name, "*", as_dict=True)
+            if not doc_dict:
+                raise frappe.DoesNotExistError
 
-        return Response(json.dumps(response), status=200, content_type="application/json")
+            # Head Imam name & profile image, and the Imams assigned to this mosque
+            _attach_imams([doc_dict])
 
-    except frappe.DoesNotExistError:
-        error = {
-            "data": None,
-            "status": "error",
-            "code": 404,
-            "message": "Mosque not found.",
-            "errors": {
-                "description": f"No Mosque found with name '{name}'"
-            },
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
+            frappe.cache().set_value(cache_key, doc_dict, expires_in_sec=300)
+
+        return _response(doc_dict, 200, "Mosque retrieved successfully.", code=200, meta=meta)
 
-        return Response(json.dumps(error), status=404, content_type="application/json")
+    except frappe.DoesNotExistError:
+        return _error(
+            "Mosque not found.",
+            404,
+            404,
+            {"description": f"No Mosque found with name '{name}'"},
+            meta
+        )
 
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Get Mosque Failed")
-        error = {
-            "data": None,
-            "status": "error",
-            "code": 400,
-            "message": "Failed to retrieve mosque.",
-            "errors": {
-                "description": str(e)
-            },
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
-
-        return Response(json.dumps(error), status=400, content_type="application/json")
+        return _error("Failed to retrieve mosque.", 400, 400, {"description": str(e)}, meta)
 
 @frappe.whitelist(allow_guest=True)
 def update_mosque():
     """Update Mosque using full payload"""
-    request_id = str(uuid.uuid4())
-    timestamp = now()
+    meta = _meta()
 
     try:
         data = frappe.local.request.get_json()
@@ -384,143 +601,126 @@ def update_mosque():
         email = payload.get("contact_email")
         phone = payload.get("contact_phone")
 
-        if email:
-            existing = frappe.db.get_value("Mosque", {"contact_email": email}, "name")
-            if existing and existing != name:
-                raise frappe.ValidationError(f"Email `{email}` is already in use.")
-
-        if phone:
-            existing = frappe.db.get_value("Mosque", {"contact_phone": phone}, "name")
-            if existing and existing != name:
-                raise frappe.ValidationError(f"Phone `{phone}` is already in use.")
+        _check_contact_conflict(email, phone, exclude=name)
 
         # Handle base64 images
-        for field in ["front_image", "back_image", "madrasa_image", "inside_image", "ceiling_image", "minbar_image"]:
-            img = payload.get(field)
-            if img and img.startswith("data:"):
-                filename = f"{field}_{uuid.uuid4().hex}.jpg"
-                payload[field] = save_base64_file(img, filename)
+        _save_images(payload)
 
         doc.update(payload)
         doc.save(ignore_permissions=True)
 
-        response = {
-            "data": {k: safe_date(v) for k, v in doc.as_dict().items()},
-            "status": "success",
-            "code": 200,
-            "message": "Mosque updated successfully.",
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
+        return _response(
+            doc.as_dict(),
+            200,
+            "Mosque updated successfully.",
+            code=200,
+            meta=meta
+        )
 
-        return Response(json.dumps(response), status=200, content_type="application/json")
+    except frappe.ValidationError as e:
+        return _error("Failed to update mosque.", 400, 400, {"description": str(e)}, meta)
 
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Update Mosque Failed")
-        error = {
-            "data": None,
-            "status": "error",
-            "code": 400,
-            "message": "Failed to update mosque.",
-            "errors": {
-                "description": str(e)
-            },
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
-        return Response(json.dumps(error), status=400, content_type="application/json")
+        return _error("Failed to update mosque.", 400, 400, {"description": str(e)}, meta)
 
 
 @frappe.whitelist(allow_guest=True)
 def delete_mosque(name=None):
     """Delete Mosque by name"""
-    request_id = str(uuid.uuid4())
-    timestamp = now()
+    meta = _meta()
 
     try:
         if not name:
             raise frappe.ValidationError("You must provide 'name' to delete a mosque.")
 
-        doc = frappe.get_doc("Mosque", name)
-        deleted_name = doc.name
-        doc.delete(ignore_permissions=True)
-
-        response = {
-            "data": {"name": deleted_name},
-            "status": "success",
-            "code": 200,
-            "message": "Mosque deleted successfully.",
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
+        if not frappe.db.exists("Mosque", name):
+            raise frappe.DoesNotExistError
+
+        frappe.delete_doc("Mosque", name, ignore_permissions=True)
 
-        return Response(json.dumps(response), status=200, content_type="application/json")
+        return _response({"name": name}, 200, "Mosque deleted successfully.", code=200, meta=meta)
 
     except frappe.DoesNotExistError:
-        error = {
-            "data": None,
-            "status": "error",
-            "code": 404,
-            "message": "Mosque not found.",
-            "errors": {
-                "description": f"No Mosque found for name={name}"
-            },
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
+        return _error(
+            "Mosque not found.",
+            404,
+            404,
+            {"description": f"No Mosque found for name={name}"},
+            meta
+        )
 
-        return Response(json.dumps(error), status=404, content_type="application/json")
+    except frappe.ValidationError as e:
+        return _error("Failed to delete mosque.", 400, 400, {"description": str(e)}, meta)
 
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Delete Mosque Failed")
-        error = {
-            "data": None,
-            "status": "error",
-            "code": 400,
-            "message": "Failed to delete mosque.",
-            "errors": {
-                "description": str(e)
-            },
-            "meta": {
-                "request_id": request_id,
-                "timestamp": timestamp
-            }
-        }
-
-        return Response(json.dumps(error), status=400, content_type="application/json")
-
-def save_base64_file(data_url, filename):
-    try:
-        # Strip out the base64 header: data:image/jpeg;base64,...
-        header, encoded = data_url.split(",", 1)
-        filedata = base64.b64decode(encoded)
-
-        # Create full file path in /files/
-        filepath = os.path.join(get_files_path(), filename)
+        return _error("Failed to delete mosque.", 400, 400, {"description": str(e)}, meta)
 
-        # Write the decoded image
-        with open(filepath, "wb") as f:
-            f.write(filedata)
+_FILES_PATHS = {}
 
-        # Create and insert the File doc
-        file_doc = frappe.get_doc({
-            "doctype": "File",
-            "file_name": filename,
-            "file_url": f"/files/{filename}",
-            "is_private": 0
-        })
-        file_doc.insert(ignore_permissions=True)
+def _files_path():
+    """Public files directory, resolved once per site; keyed by site so multi-site benches stay correct."""
+    site = frappe.local.site
+    path = _FILES_PATHS.get(site)
+    if path is None:
+        path = _FILES_PATHS[site] = get_files_path()
+    return path
 
-        return file_doc.file_url
+def _save_images(payload):
+    """Write base64 images in payload to /files, register each as a File and swap in its URL."""
+    try:
+        # One random prefix per request plus a counter keeps names unique with a single entropy read
+        prefix = secrets.token_hex(8)
+        for counter, field in enumerate(_IMAGE_FIELDS):
+            img = payload.get(field)
+            if isinstance(img, str) and img[:5] == "data:":
+                filename = f"{field}_{prefix}{counter:02x}.jpg"
+                _write_image_file(img, filename)
+
+                # Full insert: these come from public endpoints, so keep the File validations and hooks
+                file_doc = frappe.get_doc({
+                    "doctype": "File",
+                    "file_name": filename,
+                    "file_url": f"/files/{filename}",
+                    "is_private": 0
+                })
+                file_doc.insert(ignore_permissions=True)
+                payload[field] = file_doc.file_url
 
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "save_base64_file failed")
-        raise
\ No newline at end of file
+        raise
+
+def _write_image_file(data_url, filename):
+    """Decode a data URL into /files/<filename>; returns the number of bytes written."""
+    # Skip past the base64 header (data:image/jpeg;base64,...) without splitting the string
+    comma = data_url.find(",")
+    if comma == -1:
+        raise ValueError("Invalid base64 format")
+
+    # Create full file path in /files/
+    filepath = os.path.join(_files_path(), filename)
+
+    # Decode and write window by window so only one decoded window is held at a time.
+    # Line breaks and other non-alphabet chars are dropped first (as b64decode would) and any
+    # chars past the last whole 4-char quantum carry over, so windows never split a quantum.
+    written = 0
+    leftover = ""
+    fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        for start in range(comma + 1, len(data_url), _B64_WINDOW):
+            window = leftover + _B64_JUNK_RE.sub("", data_url[start:start + _B64_WINDOW])
+            cut = len(window) - len(window) % 4
+            leftover = window[cut:]
+            written += os.write(fd, base64.b64decode(window[:cut]))
+        if leftover:
+            # Some encoders drop the trailing "=" padding; b64decode needs it back
+            written += os.write(fd, base64.b64decode(leftover + "=" * (-len(leftover) % 4)))
+    except Exception:
+        os.close(fd)
+        os.unlink(filepath)  # don't leave a half-written file in /files
+        raise
+    os.close(fd)
+
+    return written
\ No newline at end of file
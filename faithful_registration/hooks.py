@@ -137,13 +137,36 @@ app_license = "agpl-3.0"
 # ---------------
 # Hook on document methods and events
 
-# doc_events = {
-# 	"*": {
-# 		"on_update": "method",
-# 		"on_cancel": "method",
-# 		"on_trash": "method"
-# 	}
-# }
+doc_events = {
+    "Household": {
+        "on_update": "faithful_registration.api.household.clear_household_list_cache",
+        "on_trash": "faithful_registration.api.household.clear_household_list_cache"
+    },
+    "Mosque": {
+        "on_update": [
+            "faithful_registration.api.imam.clear_mosque_name_cache",
+            "faithful_registration.api.mosque.clear_mosque_cache"
+        ],
+        "on_trash": [
+            "faithful_registration.api.imam.clear_mosque_name_cache",
+            "faithful_registration.api.mosque.clear_mosque_cache"
+        ]
+    },
+    "Imam": {
+        "on_update": [
+            "faithful_registration.api.mosque.clear_mosque_cache",
+            "faithful_registration.api.imam.clear_imam_by_faithful_cache"
+        ],
+        "on_trash": [
+            "faithful_registration.api.mosque.clear_mosque_cache",
+            "faithful_registration.api.imam.clear_imam_by_faithful_cache"
+        ]
+    },
+    "Faithful Profile": {
+        "on_update": "faithful_registration.api.mosque.clear_mosque_cache",
+        "on_trash": "faithful_registration.api.mosque.clear_mosque_cache"
+    }
+}
 
 # Scheduled Tasks
 # ---------------
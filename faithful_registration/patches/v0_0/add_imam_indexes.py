@@ -0,0 +1,8 @@
+import frappe
+
+
+def execute():
+    """Index the columns the Imam list/lookup endpoints filter and join on."""
+    frappe.db.add_index("Imam", ["mosque_assigned", "faithful"])
+    frappe.db.add_index("Imam Certification", ["parent", "parenttype", "parentfield"])
+    frappe.db.add_index("Mosque", ["mosque_name"])
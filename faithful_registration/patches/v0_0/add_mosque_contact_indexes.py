@@ -0,0 +1,7 @@
+import frappe
+
+
+def execute():
+    """Index the Mosque contact columns the duplicate checks look up by."""
+    frappe.db.add_index("Mosque", ["contact_email"])
+    frappe.db.add_index("Mosque", ["contact_phone"])
@@ -0,0 +1,127 @@
+import base64
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from faithful_registration.api import mosque
+
+
+class TestWriteImageFile(FrappeTestCase):
+    """_write_image_file decodes in windows; these inputs straddle window and quantum boundaries."""
+
+    def setUp(self):
+        self.files_path = tempfile.mkdtemp()
+        patcher = patch.object(mosque, "_files_path", return_value=self.files_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def decode(self, encoded):
+        written = mosque._write_image_file(f"data:image/jpeg;base64,{encoded}", "image.jpg")
+        with open(os.path.join(self.files_path, "image.jpg"), "rb") as f:
+            data = f.read()
+        self.assertEqual(written, len(data))
+        return data
+
+    def test_single_window(self):
+        data = os.urandom(1000)
+        self.assertEqual(self.decode(base64.b64encode(data).decode()), data)
+
+    def test_line_wrapped_across_windows(self):
+        # MIME base64 puts a newline every 76 chars, so no window after the first starts on a quantum
+        data = os.urandom(3 * mosque._B64_WINDOW)
+        self.assertEqual(self.decode(base64.encodebytes(data).decode()), data)
+
+    def test_crlf_wrapped(self):
+        data = os.urandom(mosque._B64_WINDOW + 7)
+        encoded = base64.encodebytes(data).decode().replace("\n", "\r\n")
+        self.assertEqual(self.decode(encoded), data)
+
+    def test_unpadded(self):
+        for size in (1, 2, mosque._B64_WINDOW + 1, mosque._B64_WINDOW + 2):
+            data = os.urandom(size)
+            self.assertEqual(self.decode(base64.b64encode(data).decode().rstrip("=")), data)
+
+    def test_invalid_input_leaves_no_file(self):
+        with self.assertRaises(ValueError):
+            self.decode("A")
+        self.assertFalse(os.path.exists(os.path.join(self.files_path, "image.jpg")))
+
+    def test_missing_header(self):
+        with self.assertRaises(ValueError):
+            mosque._write_image_file("no comma here", "image.jpg")
+
+
+def _make_mosque(**values):
+    return frappe.get_doc({
+        "doctype": "Mosque",
+        "mosque_name": f"test-mosque-{frappe.generate_hash(length=8)}",
+        **values
+    }).insert(ignore_permissions=True, ignore_mandatory=True)
+
+
+def _require_mosque_doctype():
+    if not frappe.db.exists("DocType", "Mosque"):
+        raise unittest.SkipTest("Mosque doctype is not installed on this site")
+
+
+class TestContactConflict(FrappeTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        _require_mosque_doctype()
+        cls.mosque = _make_mosque(contact_email="conflict.case@example.com", contact_phone="+255700000001")
+
+    def test_email_case_variant(self):
+        # The column's collation ignores case, so this is the same address and must be reported as such
+        with self.assertRaisesRegex(frappe.ValidationError, "Email"):
+            mosque._check_contact_conflict("Conflict.Case@Example.COM", "+255700000999")
+
+    def test_email_case_variant_without_phone(self):
+        with self.assertRaisesRegex(frappe.ValidationError, "Email"):
+            mosque._check_contact_conflict("CONFLICT.CASE@EXAMPLE.COM", None)
+
+    def test_phone(self):
+        with self.assertRaisesRegex(frappe.ValidationError, "Phone"):
+            mosque._check_contact_conflict("free.address@example.com", "+255700000001")
+
+    def test_own_record_is_excluded(self):
+        mosque._check_contact_conflict("conflict.case@example.com", "+255700000001", exclude=self.mosque.name)
+
+    def test_empty_values_match_nothing(self):
+        mosque._check_contact_conflict("", "")
+        mosque._check_contact_conflict(None, None)
+
+
+class TestMosqueListPaging(FrappeTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        _require_mosque_doctype()
+        cls.batch = [_make_mosque().name for _ in range(5)]
+        # A bulk upload stamps every row with one creation; put this batch ahead of any existing rows
+        frappe.db.sql(
+            "UPDATE `tabMosque` SET creation = %s WHERE name IN %s",
+            ("2099-01-01 00:00:00.000000", tuple(cls.batch))
+        )
+
+    def setUp(self):
+        mosque.clear_mosque_cache()
+
+    def test_pages_through_rows_sharing_a_creation(self):
+        seen, cursor = [], None
+        while len(seen) < len(self.batch):
+            response = mosque.get_all_mosques(limit=2, cursor=cursor)
+            self.assertEqual(response.status_code, 200)
+            body = json.loads(response.get_data())
+            seen.extend(r["name"] for r in body["data"])
+            cursor = body["meta"]["next_cursor"]
+            if not cursor:
+                break
+
+        self.assertEqual(seen[:len(self.batch)], sorted(self.batch, reverse=True))
+        self.assertEqual(len(seen), len(set(seen)))